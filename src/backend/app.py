@@ -4,12 +4,18 @@ import os
 # Make sure current directory is in sys.path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import queue
+import threading
+import time
+import uuid
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from typing import Dict, Any
 
 from config import DEFAULT_MODEL_PARAMS, API_PORT, DEBUG, API_HOST
-from models import get_model, get_available_models, get_model_info, get_supported_resolutions, is_model_cached
+from models import get_model, get_available_models, get_model_info, get_supported_resolutions, is_model_cached, is_model_available
+from download_manager import download_manager, DownloadJob
 from utils import save_image, validate_image_params, config_loader
 
 app = Flask(__name__)
@@ -43,6 +49,102 @@ def process_request_params(data: Dict[str, Any], model_id: str = None) -> Dict[s
     })
     return params
 
+# Generation requests waiting for their model's download to finish
+_queued_generations: Dict[str, Dict[str, Any]] = {}
+_queued_generations_lock = threading.Lock()
+
+# Finished results that are never polled are dropped after this many seconds
+QUEUED_GENERATION_TTL = 3600
+
+# Work for the single generation worker, so queued requests never run on request or download threads
+_generation_queue: "queue.Queue[tuple[str, str, Dict[str, Any]]]" = queue.Queue()
+
+def run_generation(model_id: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """Loads the model, generates and saves an image, and returns the response data."""
+    model = get_model(model_id)
+    
+    # Use model's suggested negative prompt (if user hasn't specified one)
+    if not params.get("negative_prompt") and hasattr(model, 'get_suggested_negative_prompt'):
+        suggested_negative = model.get_suggested_negative_prompt()
+        if suggested_negative:
+            params["negative_prompt"] = suggested_negative
+
+    params_without_output_dir = params.copy()
+    params_without_output_dir.pop("output_dir")
+
+    # Generate image
+    image = model.generate(**params_without_output_dir)
+
+    filename = save_image(image=image, output_dir=params["output_dir"])
+
+    # Return model information as well
+    model_info = get_model_info(model_id)
+    return {
+        "filename": filename,
+        "model_used": model_id,
+        "model_name": model_info.get('name', model_id) if model_info else model_id,
+        "params_used": params_without_output_dir
+    }
+
+def _update_queued_generation(generation_id: str, **changes) -> None:
+    with _queued_generations_lock:
+        entry = _queued_generations.get(generation_id)
+        if entry is None:
+            return
+        entry.update(changes)
+        if entry["status"] in ("completed", "failed"):
+            entry["finished_at"] = time.time()
+
+def _expire_queued_generations() -> None:
+    """Drops finished results nobody polled for within the TTL."""
+    cutoff = time.time() - QUEUED_GENERATION_TTL
+    with _queued_generations_lock:
+        expired = [
+            generation_id for generation_id, entry in _queued_generations.items()
+            if entry.get("finished_at") and entry["finished_at"] < cutoff
+        ]
+        for generation_id in expired:
+            del _queued_generations[generation_id]
+
+def _process_generation_queue() -> None:
+    """Runs queued generations one at a time once their model has been downloaded."""
+    while True:
+        generation_id, model_id, params = _generation_queue.get()
+        _update_queued_generation(generation_id, status="generating")
+        try:
+            _update_queued_generation(generation_id, status="completed", result=run_generation(model_id, params))
+        except Exception as e:
+            _update_queued_generation(generation_id, status="failed", error=str(e))
+        finally:
+            _generation_queue.task_done()
+
+def queue_generation(job: DownloadJob, model_id: str, params: Dict[str, Any]) -> str:
+    """Queues a generation to run once the model download finishes and returns its ID."""
+    _expire_queued_generations()
+
+    generation_id = uuid.uuid4().hex
+    with _queued_generations_lock:
+        _queued_generations[generation_id] = {
+            "generation_id": generation_id,
+            "model_id": model_id,
+            "status": "waiting_for_download",
+            "result": None,
+            "error": None,
+        }
+
+    # Only hands the work over, since it may run on the download thread or right here if the job already finished
+    def on_download_finished(finished_job: DownloadJob):
+        if finished_job.status != "completed":
+            _update_queued_generation(generation_id, status="failed", error=f"Model download failed: {finished_job.error}")
+            return
+        _update_queued_generation(generation_id, status="queued")
+        _generation_queue.put((generation_id, model_id, params))
+
+    job.add_done_callback(on_download_finished)
+    return generation_id
+
+threading.Thread(target=_process_generation_queue, name="generation-worker", daemon=True).start()
+
 @app.route("/generate", methods=["POST"])
 def generate_image():
     """Image generation endpoint."""
@@ -67,40 +169,47 @@ def generate_image():
         if not is_valid:
             return jsonify({"error": error_message}), 400
 
-        # Load model
+        # Queue the request instead of blocking a worker while the model downloads
+        if not is_model_available(model_id):
+            try:
+                job = download_manager.start_download(model_id)
+            except ValueError as e:
+                return jsonify({"error": str(e)}), 400
+            
+            generation_id = queue_generation(job, model_id, params)
+            return jsonify({
+                "generation_id": generation_id,
+                "status": "waiting_for_download",
+                "download": job.to_dict(),
+            }), 202
+
         try:
-            model = get_model(model_id)
+            response_data = run_generation(model_id, params)
         except ValueError as e:
             return jsonify({"error": str(e)}), 400
-        
-        # Use model's suggested negative prompt (if user hasn't specified one)
-        if not params.get("negative_prompt") and hasattr(model, 'get_suggested_negative_prompt'):
-            suggested_negative = model.get_suggested_negative_prompt()
-            if suggested_negative:
-                params["negative_prompt"] = suggested_negative
-
-        params_without_output_dir = params.copy()
-        params_without_output_dir.pop("output_dir")
-
-        # Generate image
-        image = model.generate(**params_without_output_dir)
-
-        filename = save_image(image=image, output_dir=params["output_dir"])
-
-        # Return model information as well
-        model_info = get_model_info(model_id)
-        response_data = {
-            "filename": filename,
-            "model_used": model_id,
-            "model_name": model_info.get('name', model_id) if model_info else model_id,
-            "params_used": params_without_output_dir
-        }
 
         return jsonify(response_data)
 
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/generate/<generation_id>", methods=["GET"])
+def get_queued_generation(generation_id):
+    """Returns the status (and result, once done) of a queued generation.
+    Finished results are returned once and then removed."""
+    _expire_queued_generations()
+
+    with _queued_generations_lock:
+        entry = _queued_generations.get(generation_id)
+        if entry is None:
+            return jsonify({"error": f"Generation {generation_id} not found"}), 404
+        
+        if entry["status"] in ("completed", "failed"):
+            del _queued_generations[generation_id]
+        response_data = {key: value for key, value in entry.items() if key != "finished_at"}
+
+    return jsonify(response_data)
+
 @app.route("/models", methods=["GET"])
 def get_models():
     """Returns all available models."""
@@ -180,6 +289,36 @@ def check_model_cache_status(model_id):
         print(f"[API] Error checking cache status for {model_id}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route("/models/<model_id>/download", methods=["POST"])
+def start_model_download(model_id):
+    """Starts downloading a model in the background."""
+    try:
+        if model_id not in get_available_models():
+            return jsonify({'error': f'Model {model_id} not found'}), 404
+        
+        job = download_manager.start_download(model_id)
+        return jsonify(job.to_dict()), 202
+    
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/models/<model_id>/download", methods=["GET"])
+def get_model_download_progress(model_id):
+    """Returns byte-level download progress for a model."""
+    job = download_manager.get_job(model_id)
+    if job is None:
+        return jsonify({'error': f'No download started for model {model_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/downloads", methods=["GET"])
+def get_downloads():
+    """Returns progress for all model downloads."""
+    jobs = [job.to_dict() for job in download_manager.get_jobs()]
+    return jsonify({
+        "downloads": jobs,
+        "total": len(jobs),
+    })
+
 def init_app():
     """Application startup configuration."""
     return app
@@ -0,0 +1,161 @@
+"""
+Quantization benchmark on tiny, randomly initialised pipeline components.
+Compares memory, latency, output quality and load time of each quantization mode against
+float32 (and the float16 weights used without quantization) without downloading anything,
+so it can run on any CPU host:
+
+    python benchmark_quantization.py --runs 10
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import torch
+from diffusers import UNet2DConditionModel
+from transformers import CLIPTextConfig, CLIPTextModel
+
+from utils.quantization import (
+    QUANTIZATION_MODES,
+    get_model_revision,
+    get_module_size_bytes,
+    load_cached_components,
+    quantize_pipeline,
+)
+
+
+def save_tiny_model(path: Path) -> None:
+    """Writes a toy-scale UNet and text encoder in the same layout as a diffusers pipeline on the hub."""
+    torch.manual_seed(0)
+    UNet2DConditionModel(
+        sample_size=32,
+        in_channels=4,
+        out_channels=4,
+        block_out_channels=(64, 128),
+        layers_per_block=2,
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=128,
+        attention_head_dim=8,
+    ).save_pretrained(path / "unet")
+    CLIPTextModel(CLIPTextConfig(
+        vocab_size=1000,
+        hidden_size=128,
+        intermediate_size=512,
+        num_hidden_layers=4,
+        num_attention_heads=4,
+        max_position_embeddings=77,
+    )).save_pretrained(path / "text_encoder")
+    (path / "model_index.json").write_text(json.dumps({
+        "_class_name": "TinyPipeline",
+        "unet": ["diffusers", "UNet2DConditionModel"],
+        "text_encoder": ["transformers", "CLIPTextModel"],
+    }))
+
+
+class TinyPipeline:
+    """Holds the quantizable components of a Stable Diffusion pipeline at toy scale."""
+
+    def __init__(self, unet: torch.nn.Module, text_encoder: torch.nn.Module):
+        self.unet = unet.eval()
+        self.text_encoder = text_encoder.eval()
+
+    @classmethod
+    def from_pretrained(cls, path: Path, torch_dtype: torch.dtype = torch.float32, **components) -> "TinyPipeline":
+        """Loads the components, using the given module for any component passed in (like diffusers pipelines)."""
+        unet = components.get("unet") or UNet2DConditionModel.from_pretrained(path, subfolder="unet", torch_dtype=torch_dtype)
+        text_encoder = components.get("text_encoder") or CLIPTextModel.from_pretrained(
+            path, subfolder="text_encoder", torch_dtype=torch_dtype
+        )
+        return cls(unet, text_encoder)
+
+    @torch.no_grad()
+    def __call__(self, input_ids: torch.Tensor, latents: torch.Tensor) -> torch.Tensor:
+        hidden_states = self.text_encoder(input_ids)[0]
+        return self.unet(latents.to(self.unet.dtype), 10, encoder_hidden_states=hidden_states).sample.float()
+
+
+def benchmark(pipe: TinyPipeline, input_ids: torch.Tensor, latents: torch.Tensor, runs: int) -> tuple[float, torch.Tensor]:
+    """Returns the median latency in milliseconds and the output of the last run."""
+    output = pipe(input_ids, latents)  # warm-up
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = pipe(input_ids, latents)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), output
+
+
+def timed(fn):
+    """Returns the result of fn() and how long it took in milliseconds."""
+    start = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - start) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="timed runs per mode")
+    parser.add_argument("--threads", type=int, default=None, help="torch CPU threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    torch.manual_seed(0)
+    input_ids = torch.randint(0, 1000, (1, 77))
+    latents = torch.randn(1, 4, 32, 32)
+
+    print(f"{'mode':<18}{'size (MB)':>12}{'latency (ms)':>15}{'cosine sim':>13}{'max abs err':>14}"
+          f"{'load (ms)':>12}{'cached load (ms)':>19}")
+
+    with tempfile.TemporaryDirectory() as model_dir, tempfile.TemporaryDirectory() as cache_dir:
+        model_dir, cache_dir = Path(model_dir), Path(cache_dir)
+        save_tiny_model(model_dir)
+        revision = get_model_revision(str(model_dir))
+        reference_output = None
+
+        # float32 is the reference, float16 is what unquantized models are loaded in on GPUs
+        for mode, dtype in [("none", torch.float32), ("none", torch.float16)] + [(m, torch.float32) for m in QUANTIZATION_MODES if m != "none"]:
+            label = mode if mode != "none" else str(dtype).replace("torch.", "")
+
+            def load_and_quantize():
+                pipe = TinyPipeline.from_pretrained(model_dir, torch_dtype=dtype)
+                return quantize_pipeline(pipe, mode, cache_dir, "tiny", revision)
+
+            pipe, load_ms = timed(load_and_quantize)
+            size_mb = (get_module_size_bytes(pipe.unet) + get_module_size_bytes(pipe.text_encoder)) / 2**20
+
+            cached_ms = float("nan")
+            if mode != "none":
+                def load_from_cache():
+                    cached = load_cached_components(str(model_dir), cache_dir, "tiny", revision, mode, dtype)
+                    assert set(cached) == {"unet", "text_encoder"}, "cache miss"
+                    return TinyPipeline.from_pretrained(model_dir, torch_dtype=dtype, **cached)
+
+                pipe, cached_ms = timed(load_from_cache)
+
+            try:
+                latency_ms, output = benchmark(pipe, input_ids, latents, args.runs)
+            except RuntimeError as e:
+                # Some CPU builds have no float16 kernels for every op
+                print(f"{label:<18}{size_mb:>12.2f}  (inference unsupported: {e})")
+                continue
+
+            if reference_output is None:
+                reference_output = output
+            cosine = torch.nn.functional.cosine_similarity(output.flatten(), reference_output.flatten(), dim=0).item()
+            max_error = (output - reference_output).abs().max().item()
+
+            print(f"{label:<18}{size_mb:>12.2f}{latency_ms:>15.1f}{cosine:>13.5f}{max_error:>14.5f}"
+                  f"{load_ms:>12.1f}{cached_ms:>19.1f}")
+
+    print("\nsize covers the UNet and text encoder only; on CPU the quantized modes load the rest "
+          "of a real pipeline (VAE) in float32, see README")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
+import os
 from pathlib import Path
 from utils.config_loader import config_loader
 
 # Directory configuration
 BASE_DIR = Path(__file__).resolve().parent
 
+# Downloaded models and quantized components are cached outside the app bundle, which may be read-only
+CACHE_DIR = Path(os.environ.get("SD_UI_CACHE_DIR", Path.home() / ".cache" / "stable-diffusion-ui"))
+QUANTIZATION_CACHE_DIR = CACHE_DIR / "quantized"
+MODEL_DOWNLOAD_DIR = CACHE_DIR / "models"
+
 # API configuration
 API_CONFIG = config_loader.get_api_config()
 
@@ -11,6 +17,9 @@ API_PORT = API_CONFIG.get("port", 5000)
 DEBUG = API_CONFIG.get("debug", False)
 API_HOST = API_CONFIG.get("host", "0.0.0.0")
 
+# Download manager configuration
+DOWNLOAD_CONFIG = config_loader.get_downloads_config()
+
 # Model default parameters
 DEFAULT_MODEL_PARAMS = {
     "height": 512,
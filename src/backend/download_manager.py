@@ -0,0 +1,456 @@
+"""
+In-process model download manager.
+Fetches a model's files concurrently with resumable, checksum-verified transfers
+and exposes byte-level progress for the API.
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from config import MODEL_DOWNLOAD_DIR, DOWNLOAD_CONFIG
+from utils.config_loader import config_loader
+
+# Written into a model directory once every file has been downloaded and verified
+COMPLETE_MARKER = ".download_complete"
+
+# Weight formats diffusers can load, in order of preference
+WEIGHT_EXTENSIONS = (".safetensors", ".bin")
+
+# Suffix of sharded weight files, e.g. '-00001-of-00002'
+SHARD_SUFFIX = re.compile(r"-\d+-of-\d+$")
+
+
+class ChecksumError(ValueError):
+    """Raised when a downloaded file doesn't match its expected sha256."""
+
+
+class RemoteFile:
+    """A single file of a model repository."""
+
+    def __init__(self, filename: str, url: str, size: Optional[int] = None, sha256: Optional[str] = None,
+                 headers: Optional[Dict[str, str]] = None):
+        self.filename = filename
+        self.url = url
+        self.size = size
+        self.sha256 = sha256
+        self.headers = headers or {}
+
+
+class StripAuthOnRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Drops the Authorization header when a redirect leaves the original host,
+    so Hugging Face tokens aren't sent on to the CDN serving LFS files."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        new_request = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if new_request is not None:
+            old_url, new_url = urllib.parse.urlsplit(req.full_url), urllib.parse.urlsplit(new_request.full_url)
+            if (old_url.scheme, old_url.netloc) != (new_url.scheme, new_url.netloc):
+                new_request.remove_header("Authorization")
+        return new_request
+
+
+class BandwidthLimiter:
+    """Token bucket shared by all download workers. A rate of 0 means unlimited."""
+
+    def __init__(self, max_bytes_per_second: int = 0):
+        self.max_bytes_per_second = max_bytes_per_second
+        self._next_time = time.monotonic()
+        self._lock = threading.Lock()
+
+    def consume(self, num_bytes: int) -> None:
+        """Blocks until num_bytes may be transferred without exceeding the rate."""
+        if not self.max_bytes_per_second:
+            return
+
+        with self._lock:
+            now = time.monotonic()
+            self._next_time = max(now, self._next_time) + num_bytes / self.max_bytes_per_second
+            delay = self._next_time - now
+
+        if delay > 0:
+            time.sleep(delay)
+
+
+class DownloadJob:
+    """Tracks the state and progress of one model download."""
+
+    def __init__(self, model_id: str, huggingface_id: str, target_dir: Path, variant: Optional[str] = None):
+        self.model_id = model_id
+        self.huggingface_id = huggingface_id
+        self.target_dir = target_dir
+        self.variant = variant
+        self.status = "queued"  # queued, downloading, completed, failed
+        self.error = None
+        self.files: Dict[str, Dict[str, Any]] = {}
+        self.transferred_bytes = 0  # received in this session, excluding resumed .part data
+        self.started_at = time.time()
+        self.finished_at = None
+        self._callbacks: List[Callable[["DownloadJob"], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def set_files(self, files: List[RemoteFile]) -> None:
+        with self._lock:
+            self.files = {
+                f.filename: {"size": f.size, "downloaded_bytes": 0, "status": "queued"}
+                for f in files
+            }
+            self.status = "downloading"
+
+    def update_file(self, filename: str, downloaded_bytes: Optional[int] = None, status: Optional[str] = None,
+                    transferred_bytes: int = 0) -> None:
+        with self._lock:
+            self.transferred_bytes += transferred_bytes
+            file_state = self.files[filename]
+            if downloaded_bytes is not None:
+                file_state["downloaded_bytes"] = downloaded_bytes
+            if status is not None:
+                file_state["status"] = status
+
+    def add_done_callback(self, callback: Callable[["DownloadJob"], None]) -> None:
+        """Runs callback once the job finishes, immediately if it already has."""
+        with self._lock:
+            if not self.is_finished:
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def finish(self, status: str, error: Optional[str] = None) -> None:
+        with self._lock:
+            self.status = status
+            self.error = error
+            self.finished_at = time.time()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                print(f"[DownloadManager] Callback for {self.model_id} failed: {e}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns a JSON-serializable progress snapshot."""
+        with self._lock:
+            files = [{"filename": name, **state} for name, state in self.files.items()]
+            downloaded = sum(f["downloaded_bytes"] for f in files)
+            total = sum(f["size"] or 0 for f in files)
+            elapsed = (self.finished_at or time.time()) - self.started_at
+            progress = round(downloaded / total * 100, 1) if total else 0.0
+            if self.status == "completed":
+                progress = 100.0  # also for models that were already on disk, which list no files
+
+            return {
+                "model_id": self.model_id,
+                "huggingface_id": self.huggingface_id,
+                "status": self.status,
+                "downloaded_bytes": downloaded,
+                "total_bytes": total,
+                "transferred_bytes": self.transferred_bytes,
+                "progress": progress,
+                "bytes_per_second": int(self.transferred_bytes / elapsed) if elapsed > 0 else 0,
+                "files": files,
+                "error": self.error,
+            }
+
+
+def _get_variant(filename: str) -> Optional[str]:
+    """Returns the variant of a weight file, e.g. 'fp16' for 'model.fp16.safetensors'
+    or 'model.fp16-00001-of-00002.safetensors'."""
+    stem = filename.rsplit("/", 1)[-1].rsplit(".", 1)[0]
+    stem = SHARD_SUFFIX.sub("", stem)
+    parts = stem.split(".")
+    return parts[-1] if len(parts) >= 2 else None
+
+
+def select_pipeline_files(files: List[RemoteFile], variant: Optional[str] = None) -> List[RemoteFile]:
+    """Picks the config files plus one set of weights per pipeline component,
+    so repositories shipping several formats and precisions aren't downloaded in full."""
+    selected = [f for f in files if f.filename.endswith((".json", ".txt"))]
+
+    weights_by_component: Dict[str, List[RemoteFile]] = {}
+    for f in files:
+        if "/" in f.filename and f.filename.endswith(WEIGHT_EXTENSIONS):
+            weights_by_component.setdefault(f.filename.rsplit("/", 1)[0], []).append(f)
+
+    preferred_variants = [variant, None] if variant else [None]
+    for weights in weights_by_component.values():
+        for wanted_variant in preferred_variants:
+            candidates = []
+            for extension in WEIGHT_EXTENSIONS:
+                candidates = [w for w in weights if w.filename.endswith(extension) and _get_variant(w.filename) == wanted_variant]
+                if candidates:
+                    break
+            if candidates:
+                selected.extend(candidates)
+                break
+
+    return selected
+
+
+def _is_complete_snapshot(snapshot_dir: Path) -> bool:
+    """Checks that every pipeline component of a cached snapshot has its files,
+    including the weights of components with a model config."""
+    try:
+        with open(snapshot_dir / "model_index.json", "r", encoding="utf-8") as f:
+            model_index = json.load(f)
+    except (OSError, ValueError):
+        return False
+
+    for component, spec in model_index.items():
+        if component.startswith("_") or not isinstance(spec, list) or spec[0] is None:
+            continue
+
+        component_dir = snapshot_dir / component
+        if not component_dir.is_dir():
+            return False
+        if not (component_dir / "config.json").exists():
+            continue  # tokenizers, schedulers and feature extractors have no weights
+
+        files = [p.name for p in component_dir.iterdir()]
+        if not any(name.endswith(WEIGHT_EXTENSIONS) for name in files):
+            return False
+
+        # Sharded weights are only complete when every shard in the index is present
+        for index_name in (name for name in files if ".index" in name and name.endswith(".json")):
+            with open(component_dir / index_name, "r", encoding="utf-8") as f:
+                shards = set(json.load(f).get("weight_map", {}).values())
+            if not all((component_dir / shard).exists() for shard in shards):
+                return False
+
+    return True
+
+
+def resolve_huggingface_files(huggingface_id: str, variant: Optional[str] = None) -> List[RemoteFile]:
+    """Lists the files needed to load a Hugging Face pipeline, with sizes and LFS checksums."""
+    from huggingface_hub import HfApi, hf_hub_url, get_token
+
+    info = HfApi().model_info(huggingface_id, files_metadata=True)
+    token = get_token()
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+
+    files = [
+        RemoteFile(
+            filename=sibling.rfilename,
+            url=hf_hub_url(huggingface_id, sibling.rfilename, revision=info.sha),
+            size=sibling.size,
+            sha256=sibling.lfs.sha256 if sibling.lfs else None,
+            headers=headers,
+        )
+        for sibling in info.siblings
+    ]
+    return select_pipeline_files(files, variant)
+
+
+class DownloadManager:
+    """Downloads models in background threads, sharing one concurrency and bandwidth budget."""
+
+    def __init__(self, download_dir: Path, max_concurrent_files: int = 4, max_bytes_per_second: int = 0,
+                 chunk_size: int = 1024 * 1024, max_retries: int = 3, timeout: float = 30,
+                 resolver: Callable[[str, Optional[str]], List[RemoteFile]] = resolve_huggingface_files):
+        self.download_dir = Path(download_dir)
+        self.chunk_size = chunk_size
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.resolver = resolver
+        self._limiter = BandwidthLimiter(max_bytes_per_second)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_files, thread_name_prefix="model-download")
+        self._opener = urllib.request.build_opener(StripAuthOnRedirectHandler)
+        self._jobs: Dict[str, DownloadJob] = {}
+        self._lock = threading.Lock()
+
+    def get_model_dir(self, huggingface_id: str) -> Path:
+        return self.download_dir / huggingface_id.replace("/", "--")
+
+    def get_local_model_path(self, huggingface_id: str) -> Optional[Path]:
+        """Returns the local directory of a fully downloaded model, if there is one."""
+        model_dir = self.get_model_dir(huggingface_id)
+        if (model_dir / COMPLETE_MARKER).exists():
+            return model_dir
+        return None
+
+    def is_model_downloaded(self, model_id: str) -> bool:
+        """Check whether all of a model's files are available locally, here or in the Hugging Face cache"""
+        model_config = config_loader.get_model_config_by_id(model_id)
+        if not model_config or not model_config.get('huggingface_id'):
+            return False
+
+        huggingface_id = model_config['huggingface_id']
+        if self.get_local_model_path(huggingface_id):
+            return True
+
+        # Models fetched by earlier versions through from_pretrained, which may have been interrupted
+        try:
+            from huggingface_hub import try_to_load_from_cache
+            model_index = try_to_load_from_cache(huggingface_id, "model_index.json")
+            return isinstance(model_index, str) and _is_complete_snapshot(Path(model_index).parent)
+        except Exception:
+            return False
+
+    def get_job(self, model_id: str) -> Optional[DownloadJob]:
+        with self._lock:
+            return self._jobs.get(model_id)
+
+    def get_jobs(self) -> List[DownloadJob]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def start_download(self, model_id: str) -> DownloadJob:
+        """Starts downloading a model, or returns its job if one is running or completed.
+        Models already on disk get a job that is completed right away."""
+        model_config = config_loader.get_model_config_by_id(model_id)
+        if not model_config:
+            raise ValueError(f"Unknown model: {model_id}")
+
+        huggingface_id = model_config.get('huggingface_id')
+        if not huggingface_id:
+            raise ValueError(f"huggingface_id not found in model config: {model_id}")
+
+        with self._lock:
+            job = self._jobs.get(model_id)
+            if job and job.status != "failed":
+                return job
+
+            # Mirrors DynamicModel._prepare_load_kwargs, which loads SDXL models with the fp16 variant
+            variant = 'fp16' if model_config.get('pipeline_class') == 'StableDiffusionXLPipeline' else None
+            job = DownloadJob(model_id, huggingface_id, self.get_model_dir(huggingface_id), variant)
+            self._jobs[model_id] = job
+
+        # Includes models fetched into the Hugging Face cache by from_pretrained, which load without a transfer
+        if self.is_model_downloaded(model_id):
+            print(f"[DownloadManager] {model_id} is already downloaded")
+            job.finish("completed")
+            return job
+
+        print(f"[DownloadManager] Starting download for {model_id} ({huggingface_id})")
+        threading.Thread(target=self._run_job, args=(job,), name=f"download-{model_id}", daemon=True).start()
+        return job
+
+    def _run_job(self, job: DownloadJob) -> None:
+        """Resolves a model's files, downloads them on the shared pool and waits for completion."""
+        try:
+            files = self.resolver(job.huggingface_id, job.variant)
+            if not files:
+                raise ValueError(f"No downloadable files found for {job.huggingface_id}")
+            job.set_files(files)
+
+            futures = [self._executor.submit(self._download_file, job, f) for f in files]
+            errors = []
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(str(e))
+
+            if errors:
+                raise RuntimeError(f"{len(errors)} file(s) failed: {errors[0]}")
+
+            with open(job.target_dir / COMPLETE_MARKER, "w", encoding="utf-8") as f:
+                json.dump({
+                    "huggingface_id": job.huggingface_id,
+                    "files": [remote.filename for remote in files],
+                }, f)
+
+            print(f"[DownloadManager] Download for {job.model_id} completed")
+            job.finish("completed")
+        except Exception as e:
+            print(f"[DownloadManager] Download for {job.model_id} failed: {e}")
+            job.finish("failed", str(e))
+
+    def _download_file(self, job: DownloadJob, remote_file: RemoteFile) -> None:
+        """Downloads one file, retrying transient failures from where the previous attempt stopped."""
+        path = job.target_dir / remote_file.filename
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        if path.exists() and (remote_file.size is None or path.stat().st_size == remote_file.size):
+            job.update_file(remote_file.filename, path.stat().st_size, "completed")
+            return
+
+        job.update_file(remote_file.filename, status="downloading")
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._transfer(job, remote_file, path)
+                job.update_file(remote_file.filename, status="completed")
+                return
+            except urllib.error.HTTPError as e:
+                # Client errors won't go away on retry, except rate limiting
+                if (400 <= e.code < 500 and e.code != 429) or attempt == self.max_retries:
+                    job.update_file(remote_file.filename, status="failed")
+                    raise
+            except (OSError, ChecksumError):
+                # The bad .part of a checksum mismatch is already gone, so a retry starts clean
+                if attempt == self.max_retries:
+                    job.update_file(remote_file.filename, status="failed")
+                    raise
+            except Exception:
+                job.update_file(remote_file.filename, status="failed")
+                raise
+
+            print(f"[DownloadManager] Retrying {remote_file.filename} (attempt {attempt + 2}/{self.max_retries + 1})")
+            time.sleep(min(2 ** attempt, 10))
+
+    def _transfer(self, job: DownloadJob, remote_file: RemoteFile, path: Path) -> None:
+        """Streams a file into a .part file in chunks, resuming with an HTTP Range request."""
+        part_path = path.with_name(path.name + ".part")
+        offset = part_path.stat().st_size if part_path.exists() else 0
+        if remote_file.size is not None and offset > remote_file.size:
+            offset = 0
+
+        hasher = hashlib.sha256() if remote_file.sha256 else None
+        if hasher and offset:
+            with open(part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(self.chunk_size), b""):
+                    hasher.update(chunk)
+
+        if remote_file.size is None or offset < remote_file.size:
+            headers = dict(remote_file.headers)
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+
+            request = urllib.request.Request(remote_file.url, headers=headers)
+            with self._opener.open(request, timeout=self.timeout) as response:
+                if offset and response.status != 206:
+                    # Server ignored the range request, start over
+                    offset = 0
+                    hasher = hashlib.sha256() if remote_file.sha256 else None
+
+                job.update_file(remote_file.filename, offset)
+                with open(part_path, "ab" if offset else "wb") as f:
+                    for chunk in iter(lambda: response.read(self.chunk_size), b""):
+                        self._limiter.consume(len(chunk))
+                        f.write(chunk)
+                        if hasher:
+                            hasher.update(chunk)
+                        offset += len(chunk)
+                        job.update_file(remote_file.filename, offset, transferred_bytes=len(chunk))
+
+        if remote_file.size is not None and offset != remote_file.size:
+            raise OSError(f"Incomplete download of {remote_file.filename}: {offset} of {remote_file.size} bytes")
+
+        if hasher and hasher.hexdigest() != remote_file.sha256:
+            part_path.unlink()
+            job.update_file(remote_file.filename, 0)
+            raise ChecksumError(f"Checksum mismatch for {remote_file.filename}")
+
+        os.replace(part_path, path)
+
+
+# Global instance
+download_manager = DownloadManager(
+    MODEL_DOWNLOAD_DIR,
+    max_concurrent_files=DOWNLOAD_CONFIG.get("max_concurrent_files", 4),
+    max_bytes_per_second=DOWNLOAD_CONFIG.get("max_bytes_per_second", 0),
+    chunk_size=DOWNLOAD_CONFIG.get("chunk_size_kb", 1024) * 1024,
+)
@@ -2,9 +2,19 @@ from diffusers import StableDiffusionPipeline, StableDiffusionXLPipeline
 import torch
 import os
 import sys
+import threading
 from typing import Any, Dict, Type, Callable, Optional
-from utils import get_device
+from utils import (
+    get_device,
+    quantize_pipeline,
+    load_cached_components,
+    get_model_revision,
+    resolve_quantization_mode,
+    get_torch_dtype,
+)
 from utils.config_loader import config_loader
+from config import QUANTIZATION_CACHE_DIR
+from download_manager import download_manager
 import logging
 from transformers import logging as transformers_logging
 
@@ -26,6 +36,9 @@ _progress_callback: Optional[Callable[[str, float], None]] = None
 # Global cache for models
 _model_cache = {}
 
+# Serializes pipeline loading so concurrent requests never load the same model twice
+_model_load_lock = threading.Lock()
+
 def set_progress_callback(callback: Callable[[str, float], None]):
     """Set the global progress callback function"""
     global _progress_callback
@@ -80,8 +93,9 @@ def is_model_cached(model_id: str) -> bool:
         print(f"[INFO] Testing model loading for {huggingface_id}...")
         
         # First try with local_files_only to see if it's fully cached
+        local_path = download_manager.get_local_model_path(huggingface_id)
         test_pipe = pipeline_class.from_pretrained(
-            huggingface_id,
+            str(local_path) if local_path else huggingface_id,
             torch_dtype=torch.float16,
             local_files_only=True,  # Only use local files, don't download
             low_cpu_mem_usage=True,  # Don't actually load to GPU
@@ -98,32 +112,53 @@ def is_model_cached(model_id: str) -> bool:
         print(f"[INFO] Model {model_id} is not properly cached: {str(e)}")
         return False
 
+def is_model_available(model_id: str) -> bool:
+    """Check if a model can be loaded without downloading (in memory or files on disk)"""
+    return model_id in _model_cache or download_manager.is_model_downloaded(model_id)
+
 class BaseModel:
     def __init__(self):
         self.device = get_device()
         self.pipe = None
         self.model_config = None
 
-    def _load_model(self, model_id: str, model_class: Type[Any] = StableDiffusionPipeline, **kwargs) -> None:
-        """Model loading operation with fallback for variant issues"""
+    def _load_model(self, model_id: str, model_class: Type[Any] = StableDiffusionPipeline,
+                    quantization: Optional[str] = None, **kwargs) -> None:
+        """Model loading operation with fallback for variant issues and optional int8 quantization"""
         print(f"\n{'='*60}")
         print(f"Loading model: {model_id}")
         print(f"{'='*60}")
         
+        quantization = resolve_quantization_mode(quantization, self.device)
+        torch_dtype = get_torch_dtype(quantization, self.device)
+        
+        # Prefer a copy fetched by the download manager over the Hugging Face hub/cache
+        local_path = download_manager.get_local_model_path(model_id)
+        source = str(local_path) if local_path else model_id
+        
+        # Components quantized by a previous run for the same model revision and library versions
+        # are handed to from_pretrained, so their full precision weights are never read
+        revision = get_model_revision(source) if quantization != "none" else None
+        cached_components = {}
+        if revision:
+            cached_components = load_cached_components(source, QUANTIZATION_CACHE_DIR, model_id, revision,
+                                                       quantization, torch_dtype)
+            kwargs = {**kwargs, **cached_components}
+        
         try:
             emit_progress(f"Downloading model {model_id}...")
             emit_progress("This may take several minutes for the first time...", 10)
             
-            print(f"Attempting to download from: {model_id}")
+            print(f"Attempting to load from: {source}")
             print("Progress will be shown below...")
             sys.stdout.flush()
             
             # Try loading with provided kwargs first
             self.pipe = model_class.from_pretrained(
-                model_id,
-                torch_dtype=torch.float16,
+                source,
+                torch_dtype=torch_dtype,
                 **kwargs
-            ).to(self.device)
+            )
             
             emit_progress(f"Model {model_id} loaded successfully", 80)
             print(f"[OK] Model {model_id} loaded successfully!")
@@ -143,16 +178,26 @@ class BaseModel:
             
             try:
                 self.pipe = model_class.from_pretrained(
-                    model_id,
-                    torch_dtype=torch.float16,
+                    source,
+                    torch_dtype=torch_dtype,
                     **fallback_kwargs
-                ).to(self.device)
+                )
                 emit_progress(f"Model {model_id} loaded successfully with fallback method", 80)
                 print(f"[OK] Model {model_id} loaded successfully with fallback method!")
             except Exception as fallback_error:
                 print(f"[ERROR] Fallback loading also failed: {fallback_error}")
                 emit_progress(f"Fallback loading also failed: {fallback_error}")
                 raise fallback_error
+        
+        if quantization != "none":
+            emit_progress(f"Applying {quantization} quantization to {model_id}...", 82)
+            # A model fetched from the hub just now only has a snapshot revision after loading
+            revision = revision or get_model_revision(source)
+            quantize_pipeline(self.pipe, quantization, QUANTIZATION_CACHE_DIR, model_id, revision,
+                              skip=cached_components.keys())
+            print(f"[OK] Model {model_id} quantized ({quantization})")
+        
+        self.pipe = self.pipe.to(self.device)
                 
         print("Optimizing model for inference...")
         emit_progress("Optimizing model for inference...", 85)
@@ -212,7 +257,7 @@ class DynamicModel(BaseModel):
         load_kwargs = self._prepare_load_kwargs(model_config)
         
         # Load model
-        self._load_model(huggingface_id, pipeline_class, **load_kwargs)
+        self._load_model(huggingface_id, pipeline_class, model_config.get('quantization'), **load_kwargs)
         
         # Cache the model
         if model_id:
@@ -287,7 +332,12 @@ class ModelFactory:
             raise ValueError(f"Unknown model: {model_id}. Available models: {available_model_ids}")
         
         model_config = available_models[model_id]
-        return DynamicModel(model_config)
+        if model_id in _model_cache:
+            return DynamicModel(model_config)
+        
+        # DynamicModel re-checks the cache, so whoever waited on the lock reuses the loaded pipeline
+        with _model_load_lock:
+            return DynamicModel(model_config)
 
     @staticmethod
     def get_model_info(model_id: str) -> Dict[str, Any]:
@@ -343,5 +393,6 @@ __all__ = [
     'get_supported_resolutions',
     'set_progress_callback',
     'emit_progress',
-    'is_model_cached'
+    'is_model_cached',
+    'is_model_available'
 ]
\ No newline at end of file
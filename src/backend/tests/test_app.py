@@ -0,0 +1,124 @@
+import hashlib
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("flask")
+# app imports the model pipelines
+pytest.importorskip("torch")
+pytest.importorskip("diffusers")
+
+import app as backend_app
+from download_manager import DownloadManager, RemoteFile
+
+MODEL_ID = "dreamshaper_8"
+
+
+class StubResolver:
+    """Lists one local file once released, or fails if given an error."""
+
+    def __init__(self, tmp_path, error=None):
+        self.release = threading.Event()
+        self.error = error
+        self.source = tmp_path / "source.safetensors"
+        self.source.write_bytes(b"weights" * 1000)
+
+    def __call__(self, huggingface_id, variant):
+        assert self.release.wait(10)
+        if self.error:
+            raise self.error
+        data = self.source.read_bytes()
+        return [RemoteFile("unet/model.safetensors", self.source.as_uri(), len(data), hashlib.sha256(data).hexdigest())]
+
+
+@pytest.fixture
+def resolver(tmp_path):
+    return StubResolver(tmp_path)
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch, resolver):
+    manager = DownloadManager(tmp_path / "models", max_concurrent_files=2, resolver=resolver)
+    generations = []
+
+    def run_generation(model_id, params):
+        generations.append((model_id, params))
+        return {"filename": "image.png", "model_used": model_id}
+
+    # Ignore whatever the Hugging Face cache of this machine holds
+    monkeypatch.setattr(manager, "is_model_downloaded",
+                        lambda model_id: manager.get_local_model_path("Lykon/dreamshaper-8") is not None)
+    monkeypatch.setattr(backend_app, "download_manager", manager)
+    monkeypatch.setattr(backend_app, "run_generation", run_generation)
+    monkeypatch.setattr(backend_app, "is_model_available", manager.is_model_downloaded)
+
+    client = backend_app.app.test_client()
+    client.generations = generations
+    yield client
+    resolver.release.set()
+
+
+def wait_for(fetch, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        data = fetch()
+        if condition(data) or time.monotonic() > deadline:
+            return data
+        time.sleep(0.05)
+
+
+def test_download_endpoints(client, resolver):
+    assert client.post("/models/unknown/download").status_code == 404
+    assert client.get(f"/models/{MODEL_ID}/download").status_code == 404
+
+    response = client.post(f"/models/{MODEL_ID}/download")
+    assert response.status_code == 202
+    assert response.get_json()["status"] == "queued"
+
+    resolver.release.set()
+    progress = wait_for(lambda: client.get(f"/models/{MODEL_ID}/download").get_json(),
+                        lambda data: data["status"] == "completed")
+
+    assert progress["status"] == "completed", progress["error"]
+    assert progress["progress"] == 100.0
+    assert progress["downloaded_bytes"] == progress["total_bytes"] == 7000
+
+    downloads = client.get("/downloads").get_json()
+    assert downloads["total"] == 1
+    assert downloads["downloads"][0]["model_id"] == MODEL_ID
+
+
+def test_generation_waits_for_download(client, resolver, tmp_path):
+    response = client.post("/generate", json={"prompt": "a cat", "model": MODEL_ID, "output_dir": str(tmp_path)})
+
+    assert response.status_code == 202
+    generation_id = response.get_json()["generation_id"]
+    assert client.get(f"/generate/{generation_id}").get_json()["status"] == "waiting_for_download"
+    assert client.generations == []
+
+    resolver.release.set()
+    result = wait_for(lambda: client.get(f"/generate/{generation_id}").get_json(),
+                      lambda data: data["status"] in ("completed", "failed"))
+
+    assert result["status"] == "completed", result["error"]
+    assert result["result"] == {"filename": "image.png", "model_used": MODEL_ID}
+    assert [model_id for model_id, _ in client.generations] == [MODEL_ID]
+
+    # Finished results are handed out once
+    assert client.get(f"/generate/{generation_id}").status_code == 404
+
+
+def test_failed_download_fails_generation(client, resolver, tmp_path):
+    resolver.error = OSError("connection reset")
+    response = client.post("/generate", json={"prompt": "a cat", "model": MODEL_ID, "output_dir": str(tmp_path)})
+    generation_id = response.get_json()["generation_id"]
+
+    resolver.release.set()
+    result = wait_for(lambda: client.get(f"/generate/{generation_id}").get_json(),
+                      lambda data: data["status"] in ("completed", "failed"))
+
+    assert result["status"] == "failed"
+    assert "connection reset" in result["error"]
+    assert client.generations == []
+    assert client.get(f"/models/{MODEL_ID}/download").get_json()["status"] == "failed"
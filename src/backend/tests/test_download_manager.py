@@ -0,0 +1,257 @@
+import hashlib
+import http.server
+import json
+import os
+import threading
+import time
+
+import pytest
+
+from download_manager import COMPLETE_MARKER, DownloadManager, RemoteFile, _is_complete_snapshot, select_pipeline_files
+
+MODEL_ID = "dreamshaper_8"
+HUGGINGFACE_ID = "Lykon/dreamshaper-8"
+
+
+class FileServerHandler(http.server.BaseHTTPRequestHandler):
+    """Serves in-memory files with support for 'Range: bytes=N-' requests and redirects."""
+
+    files = {}
+    redirects = {}
+    requests = []
+    authorizations = []
+    delay = 0
+    in_flight = 0
+    max_in_flight = 0
+    counter_lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        name = self.path.lstrip("/")
+        self.authorizations.append(self.headers.get("Authorization"))
+        if name in self.redirects:
+            self.send_response(302)
+            self.send_header("Location", self.redirects[name])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        data = self.files.get(name)
+        if data is None:
+            self.send_error(404)
+            return
+
+        range_header = self.headers.get("Range")
+        self.requests.append((name, range_header))
+
+        cls = type(self)
+        with cls.counter_lock:
+            cls.in_flight += 1
+            cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        try:
+            time.sleep(self.delay)
+            start = 0
+            if range_header:
+                start = int(range_header.split("=")[1].rstrip("-"))
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            else:
+                self.send_response(200)
+
+            body = data[start:]
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.counter_lock:
+                cls.in_flight -= 1
+
+
+def start_server(handler):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/"
+
+
+@pytest.fixture
+def file_server():
+    handler = type("Handler", (FileServerHandler,), {
+        "files": {}, "redirects": {}, "requests": [], "authorizations": [],
+    })
+    server, base_url = start_server(handler)
+    yield base_url, handler
+    server.shutdown()
+    server.server_close()
+
+
+def serve(handler, base_url, files, sha256_overrides=None, headers=None):
+    """Publishes files on the stand-in server and returns a resolver listing them."""
+    handler.files.update(files)
+    sha256_overrides = sha256_overrides or {}
+
+    def resolver(huggingface_id, variant):
+        return [
+            RemoteFile(name, base_url + name, len(data), sha256_overrides.get(name, hashlib.sha256(data).hexdigest()),
+                       headers)
+            for name, data in files.items()
+        ]
+    return resolver
+
+
+def download(manager, timeout=30):
+    job = manager.start_download(MODEL_ID)
+    done = threading.Event()
+    job.add_done_callback(lambda _: done.set())
+    assert done.wait(timeout)
+    return job
+
+
+def test_resumes_from_existing_part_file(tmp_path, file_server):
+    base_url, handler = file_server
+    data = os.urandom(200_000)
+    manager = DownloadManager(tmp_path, resolver=serve(handler, base_url, {"unet/model.safetensors": data}))
+
+    model_dir = manager.get_model_dir(HUGGINGFACE_ID)
+    (model_dir / "unet").mkdir(parents=True)
+    (model_dir / "unet" / "model.safetensors.part").write_bytes(data[:120_000])
+
+    job = download(manager)
+
+    assert job.status == "completed", job.error
+    assert handler.requests == [("unet/model.safetensors", "bytes=120000-")]
+    assert (model_dir / "unet" / "model.safetensors").read_bytes() == data
+    assert not (model_dir / "unet" / "model.safetensors.part").exists()
+    assert manager.get_local_model_path(HUGGINGFACE_ID) == model_dir
+
+    progress = job.to_dict()
+    assert progress["downloaded_bytes"] == progress["total_bytes"] == len(data)
+    assert progress["transferred_bytes"] == 80_000  # the resumed part doesn't count towards the rate
+    assert progress["progress"] == 100.0
+
+
+def test_rejects_checksum_mismatch(tmp_path, file_server):
+    base_url, handler = file_server
+    resolver = serve(handler, base_url, {"unet/model.safetensors": os.urandom(50_000)},
+                     sha256_overrides={"unet/model.safetensors": "0" * 64})
+    manager = DownloadManager(tmp_path, max_retries=1, resolver=resolver)
+
+    job = download(manager)
+
+    assert job.status == "failed"
+    assert "Checksum mismatch" in job.error
+    assert len(handler.requests) == 2  # the mismatch is retried once from scratch
+    model_dir = manager.get_model_dir(HUGGINGFACE_ID)
+    assert not (model_dir / "unet" / "model.safetensors").exists()
+    assert not (model_dir / "unet" / "model.safetensors.part").exists()
+    assert manager.get_local_model_path(HUGGINGFACE_ID) is None
+
+
+def test_throttles_to_max_bytes_per_second(tmp_path, file_server):
+    base_url, handler = file_server
+    files = {"unet/model.safetensors": os.urandom(150_000), "text_encoder/model.safetensors": os.urandom(150_000)}
+    manager = DownloadManager(tmp_path, max_bytes_per_second=200_000, chunk_size=16 * 1024,
+                              resolver=serve(handler, base_url, files))
+
+    start = time.monotonic()
+    job = download(manager)
+    elapsed = time.monotonic() - start
+
+    # 300 KB shared across both workers at 200 KB/s takes at least ~1.5 s
+    assert job.status == "completed", job.error
+    assert elapsed >= 1.3
+
+
+def test_limits_concurrent_files(tmp_path, file_server):
+    base_url, handler = file_server
+    handler.delay = 0.2
+    files = {f"unet/model-0000{i}-of-00005.safetensors": os.urandom(1000) for i in range(1, 6)}
+    manager = DownloadManager(tmp_path, max_concurrent_files=2, resolver=serve(handler, base_url, files))
+
+    job = download(manager)
+
+    assert job.status == "completed", job.error
+    assert len(handler.requests) == 5
+    assert handler.max_in_flight == 2
+
+
+def test_strips_authorization_on_cross_host_redirect(tmp_path, file_server):
+    base_url, handler = file_server
+    cdn_handler = type("CdnHandler", (FileServerHandler,), {
+        "files": {}, "redirects": {}, "requests": [], "authorizations": [],
+    })
+    cdn_server, cdn_url = start_server(cdn_handler)
+    try:
+        data = os.urandom(10_000)
+        cdn_handler.files["blob"] = data
+        handler.redirects["unet/model.safetensors"] = cdn_url + "blob"
+        resolver = serve(handler, base_url, {"unet/model.safetensors": data},
+                         headers={"Authorization": "Bearer secret"})
+        manager = DownloadManager(tmp_path, resolver=resolver)
+
+        job = download(manager)
+    finally:
+        cdn_server.shutdown()
+        cdn_server.server_close()
+
+    assert job.status == "completed", job.error
+    assert handler.authorizations == ["Bearer secret"]
+    assert cdn_handler.authorizations == [None]
+
+
+def test_already_downloaded_model_is_not_fetched_again(tmp_path, file_server):
+    base_url, handler = file_server
+    manager = DownloadManager(tmp_path, resolver=serve(handler, base_url, {"unet/model.safetensors": b"weights"}))
+    model_dir = manager.get_model_dir(HUGGINGFACE_ID)
+    model_dir.mkdir(parents=True)
+    (model_dir / COMPLETE_MARKER).write_text("{}")
+
+    job = manager.start_download(MODEL_ID)
+
+    assert job.status == "completed"
+    assert job.to_dict()["progress"] == 100.0
+    assert handler.requests == []
+
+
+def test_selects_sharded_variant_weights():
+    names = [
+        "model_index.json",
+        "unet/config.json",
+        "unet/diffusion_pytorch_model-00001-of-00002.safetensors",
+        "unet/diffusion_pytorch_model-00002-of-00002.safetensors",
+        "unet/diffusion_pytorch_model.fp16-00001-of-00002.safetensors",
+        "unet/diffusion_pytorch_model.fp16-00002-of-00002.safetensors",
+        "text_encoder/model.safetensors",
+        "text_encoder/pytorch_model.bin",
+    ]
+    files = [RemoteFile(name, name) for name in names]
+
+    selected = {f.filename for f in select_pipeline_files(files, "fp16")}
+
+    assert selected == {
+        "model_index.json",
+        "unet/config.json",
+        "unet/diffusion_pytorch_model.fp16-00001-of-00002.safetensors",
+        "unet/diffusion_pytorch_model.fp16-00002-of-00002.safetensors",
+        "text_encoder/model.safetensors",
+    }
+
+
+def test_snapshot_without_weights_is_incomplete(tmp_path):
+    (tmp_path / "model_index.json").write_text(json.dumps({
+        "_class_name": "StableDiffusionPipeline",
+        "unet": ["diffusers", "UNet2DConditionModel"],
+        "tokenizer": ["transformers", "CLIPTokenizer"],
+        "safety_checker": [None, None],
+    }))
+    (tmp_path / "unet").mkdir()
+    (tmp_path / "unet" / "config.json").write_text("{}")
+    (tmp_path / "tokenizer").mkdir()
+    (tmp_path / "tokenizer" / "vocab.json").write_text("{}")
+
+    # An interrupted from_pretrained leaves configs behind without weights
+    assert not _is_complete_snapshot(tmp_path)
+
+    (tmp_path / "unet" / "diffusion_pytorch_model.safetensors").write_bytes(b"weights")
+    assert _is_complete_snapshot(tmp_path)
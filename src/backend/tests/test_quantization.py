@@ -0,0 +1,178 @@
+import json
+import types
+
+import pytest
+
+torch = pytest.importorskip("torch")
+from torch import nn
+
+from utils.quantization import (
+    Int8WeightOnlyConv2d,
+    Int8WeightOnlyLinear,
+    _cache_path,
+    get_model_revision,
+    load_cached_components,
+    quantize_pipeline,
+)
+
+
+class TinyComponent(nn.Sequential):
+    """Stand-in for a UNet/text encoder: conv and linear layers plus the dtype attribute pipelines expose."""
+
+    def __init__(self):
+        super().__init__(
+            nn.Conv2d(4, 16, 3, padding=1),
+            nn.SiLU(),
+            nn.Flatten(),
+            nn.Linear(16 * 8 * 8, 64),
+            nn.SiLU(),
+            nn.Linear(64, 32),
+        )
+
+    @property
+    def dtype(self) -> torch.dtype:
+        return next(self.parameters()).dtype
+
+
+def make_pipeline(seed: int = 0):
+    torch.manual_seed(seed)
+    return types.SimpleNamespace(unet=TinyComponent().eval(), text_encoder=TinyComponent().eval())
+
+
+def run(module: nn.Module) -> torch.Tensor:
+    torch.manual_seed(1)
+    with torch.no_grad():
+        return module(torch.randn(2, 4, 8, 8))
+
+
+@pytest.mark.parametrize("mode", ["int8_weight_only", "int8_dynamic"])
+def test_output_stays_close_to_float32(mode):
+    pipe = make_pipeline()
+    reference = run(pipe.unet)
+
+    quantize_pipeline(pipe, mode)
+    output = run(pipe.unet)
+
+    cosine = torch.nn.functional.cosine_similarity(output.flatten(), reference.flatten(), dim=0)
+    assert cosine > 0.999
+    assert (output - reference).abs().max() < 0.05 * reference.abs().max()
+
+
+def test_weight_only_replaces_conv_and_linear():
+    pipe = quantize_pipeline(make_pipeline(), "int8_weight_only")
+
+    assert isinstance(pipe.unet[0], Int8WeightOnlyConv2d)
+    assert isinstance(pipe.unet[3], Int8WeightOnlyLinear)
+    assert pipe.unet[3].weight_int8.dtype == torch.int8
+
+
+def test_dynamic_gives_convs_int8_weights():
+    pipe = quantize_pipeline(make_pipeline(), "int8_dynamic")
+
+    assert isinstance(pipe.unet[0], Int8WeightOnlyConv2d)
+    assert isinstance(pipe.unet[3], torch.ao.nn.quantized.dynamic.Linear)
+
+
+def save_tiny_model(path):
+    """Writes a toy UNet and CLIP text encoder in the layout of a diffusers pipeline."""
+    diffusers = pytest.importorskip("diffusers")
+    transformers = pytest.importorskip("transformers")
+    pytest.importorskip("accelerate")
+
+    torch.manual_seed(0)
+    diffusers.UNet2DConditionModel(
+        sample_size=8,
+        block_out_channels=(32, 64),
+        layers_per_block=1,
+        down_block_types=("CrossAttnDownBlock2D", "DownBlock2D"),
+        up_block_types=("UpBlock2D", "CrossAttnUpBlock2D"),
+        cross_attention_dim=32,
+    ).save_pretrained(path / "unet")
+    transformers.CLIPTextModel(transformers.CLIPTextConfig(
+        vocab_size=100, hidden_size=32, intermediate_size=64, num_hidden_layers=2,
+        num_attention_heads=4, max_position_embeddings=16,
+    )).save_pretrained(path / "text_encoder")
+    (path / "model_index.json").write_text(json.dumps({
+        "_class_name": "StableDiffusionPipeline",
+        "unet": ["diffusers", "UNet2DConditionModel"],
+        "text_encoder": ["transformers", "CLIPTextModel"],
+    }))
+    return types.SimpleNamespace(
+        unet=diffusers.UNet2DConditionModel.from_pretrained(path, subfolder="unet").eval(),
+        text_encoder=transformers.CLIPTextModel.from_pretrained(path, subfolder="text_encoder").eval(),
+    )
+
+
+def run_unet(unet):
+    torch.manual_seed(1)
+    with torch.no_grad():
+        return unet(torch.randn(1, 4, 8, 8), 10, encoder_hidden_states=torch.randn(1, 16, 32)).sample
+
+
+@pytest.mark.parametrize("mode", ["int8_weight_only", "int8_dynamic"])
+def test_cache_round_trip(tmp_path, mode):
+    model_dir, cache_dir = tmp_path / "model", tmp_path / "cache"
+    pipe = save_tiny_model(model_dir)
+    revision = get_model_revision(str(model_dir))
+    quantize_pipeline(pipe, mode, cache_dir, "org/tiny", revision)
+    expected = run_unet(pipe.unet)
+
+    assert len(list(cache_dir.rglob("*.pt"))) == 2
+
+    # Rebuilt from configs and the cache alone, without reading the float weights
+    (model_dir / "unet" / "diffusion_pytorch_model.safetensors").unlink()
+    cached = load_cached_components(str(model_dir), cache_dir, "org/tiny", revision, mode, torch.float32)
+
+    assert set(cached) == {"unet", "text_encoder"}
+    assert torch.equal(run_unet(cached["unet"]), expected)
+    assert isinstance(cached["unet"].conv_in, Int8WeightOnlyConv2d)
+
+
+def test_mismatched_cache_file_is_deleted(tmp_path):
+    model_dir, cache_dir = tmp_path / "model", tmp_path / "cache"
+    save_tiny_model(model_dir)
+    path = _cache_path(cache_dir, "org/tiny", "abc123", "unet", "int8_weight_only", torch.float32)
+    path.parent.mkdir(parents=True)
+    torch.save({"conv_in.weight_int8": torch.zeros(1, dtype=torch.int8)}, path)
+
+    cached = load_cached_components(str(model_dir), cache_dir, "org/tiny", "abc123", "int8_weight_only", torch.float32)
+
+    assert cached == {}
+    assert not path.exists()
+
+
+def test_local_revision_follows_weight_files(tmp_path):
+    (tmp_path / "unet").mkdir()
+    weights = tmp_path / "unet" / "diffusion_pytorch_model.safetensors"
+    weights.write_bytes(b"weights")
+    revision = get_model_revision(str(tmp_path))
+
+    assert revision.startswith("local-")
+    assert get_model_revision(str(tmp_path)) == revision
+
+    weights.write_bytes(b"other weights")
+    assert get_model_revision(str(tmp_path)) != revision
+
+
+def test_cache_is_keyed_on_revision(tmp_path):
+    quantize_pipeline(make_pipeline(), "int8_weight_only", tmp_path, "org/tiny", "abc123")
+
+    assert load_cached_components(str(tmp_path), tmp_path, "org/tiny", "def456", "int8_weight_only", torch.float32) == {}
+
+
+def test_nothing_cached_without_revision(tmp_path):
+    quantize_pipeline(make_pipeline(), "int8_weight_only", tmp_path, "org/tiny", None)
+
+    assert list(tmp_path.rglob("*.pt")) == []
+
+
+def test_skip_leaves_components_untouched(tmp_path):
+    pipe = make_pipeline()
+    unet = pipe.unet
+
+    quantize_pipeline(pipe, "int8_weight_only", tmp_path, "org/tiny", "abc123", skip=["unet"])
+
+    assert pipe.unet is unet
+    assert isinstance(pipe.unet[3], nn.Linear)
+    assert isinstance(pipe.text_encoder[3], Int8WeightOnlyLinear)
+    assert [p.name.split("-")[0] for p in tmp_path.rglob("*.pt")] == ["text_encoder"]
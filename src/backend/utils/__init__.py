@@ -1,13 +1,40 @@
+import importlib
+
 from .save_image import save_image
 from .validation import validate_image_params  
 from .generate_unique_filename import generate_unique_filename
-from .get_device import get_device
 from .config_loader import config_loader
 
+# Helpers that need torch are imported on first use, so config and the
+# download manager can be loaded without it
+_TORCH_EXPORTS = {
+    'get_device': '.get_device',
+    'quantize_pipeline': '.quantization',
+    'load_cached_components': '.quantization',
+    'get_model_revision': '.quantization',
+    'resolve_quantization_mode': '.quantization',
+    'get_torch_dtype': '.quantization',
+}
+
+
+def __getattr__(name):
+    if name not in _TORCH_EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_TORCH_EXPORTS[name], __name__), name)
+    # Importing the submodule binds e.g. utils.get_device to the module, replace it with the function
+    globals()[name] = value
+    return value
+
+
 __all__ = [
     'save_image',
     'validate_image_params',
     'generate_unique_filename', 
     'get_device',
-    'config_loader'
+    'config_loader',
+    'quantize_pipeline',
+    'load_cached_components',
+    'get_model_revision',
+    'resolve_quantization_mode',
+    'get_torch_dtype'
 ] 
\ No newline at end of file
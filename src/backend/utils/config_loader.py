@@ -82,6 +82,11 @@ class ConfigLoader:
         """Get API configuration."""
         app_config = self.load_app_config()
         return app_config.get('api', {})
+    
+    def get_downloads_config(self) -> Dict[str, Any]:
+        """Get model download manager configuration."""
+        app_config = self.load_app_config()
+        return app_config.get('downloads', {})
 
 # Global instance
 config_loader = ConfigLoader()
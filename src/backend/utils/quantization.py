@@ -0,0 +1,302 @@
+"""
+Int8 quantization helpers for diffusion pipelines.
+Quantized components are cached on disk as state dicts, keyed on the model revision
+and library versions. Cached components are rebuilt from their configs without ever
+reading the full precision weights.
+"""
+
+import hashlib
+import importlib
+import itertools
+import os
+import re
+from importlib import metadata
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional
+
+import torch
+import torch.nn.functional as F
+from torch import nn
+
+# Supported values for the per-model "quantization" option in models.json
+QUANTIZATION_MODES = ("none", "int8_dynamic", "int8_weight_only")
+
+# Pipeline components that hold most of the weights
+QUANTIZABLE_COMPONENTS = ("unet", "text_encoder", "text_encoder_2")
+
+
+class Int8WeightOnlyLinear(nn.Module):
+    """Linear layer storing int8 weights with per-output-channel scales."""
+
+    def __init__(self, linear: nn.Linear):
+        super().__init__()
+        weight, scale = _quantize_per_channel(linear.weight.data)
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+        self.register_buffer("weight_int8", weight)
+        self.register_buffer("scale", scale.to(linear.weight.dtype))
+        self.bias = linear.bias
+
+    @property
+    def weight(self) -> torch.Tensor:
+        return self.weight_int8.to(self.scale.dtype) * self.scale.view(-1, 1)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.linear(x, self.weight.to(x.dtype), self.bias)
+
+
+class Int8WeightOnlyConv2d(nn.Module):
+    """Conv2d layer storing int8 weights with per-output-channel scales."""
+
+    def __init__(self, conv: nn.Conv2d):
+        super().__init__()
+        weight, scale = _quantize_per_channel(conv.weight.data)
+        self.in_channels = conv.in_channels
+        self.out_channels = conv.out_channels
+        self.kernel_size = conv.kernel_size
+        self.stride = conv.stride
+        self.padding = conv.padding
+        self.dilation = conv.dilation
+        self.groups = conv.groups
+        self.register_buffer("weight_int8", weight)
+        self.register_buffer("scale", scale.to(conv.weight.dtype))
+        self.bias = conv.bias
+
+    @property
+    def weight(self) -> torch.Tensor:
+        return self.weight_int8.to(self.scale.dtype) * self.scale.view(-1, 1, 1, 1)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return F.conv2d(x, self.weight.to(x.dtype), self.bias, self.stride, self.padding, self.dilation, self.groups)
+
+
+def _quantize_per_channel(weight: torch.Tensor) -> tuple[torch.Tensor, torch.Tensor]:
+    """Symmetric int8 quantization along the first (output) dimension."""
+    flat = weight.float().reshape(weight.shape[0], -1)
+    scale = flat.abs().amax(dim=1).clamp(min=1e-8) / 127.0
+    quantized = torch.round(flat / scale.unsqueeze(1)).clamp(-127, 127).to(torch.int8)
+    return quantized.reshape(weight.shape), scale
+
+
+def _replace_weight_only(module: nn.Module, convs_only: bool = False) -> None:
+    """Recursively swap Linear/Conv2d children (or only Conv2d) for their int8 weight-only versions."""
+    for name, child in module.named_children():
+        if isinstance(child, nn.Linear) and not convs_only:
+            setattr(module, name, Int8WeightOnlyLinear(child))
+        elif isinstance(child, nn.Conv2d) and child.padding_mode == "zeros":
+            setattr(module, name, Int8WeightOnlyConv2d(child))
+        else:
+            _replace_weight_only(child, convs_only)
+
+
+def _replace_dynamic_linear_skeleton(module: nn.Module) -> None:
+    """Recursively swap the Linear children quantize_dynamic would convert for empty dynamic quantized ones."""
+    for name, child in module.named_children():
+        if type(child) is nn.Linear:
+            setattr(module, name, torch.ao.nn.quantized.dynamic.Linear(
+                child.in_features, child.out_features, bias_=child.bias is not None, dtype=torch.qint8
+            ))
+        else:
+            _replace_dynamic_linear_skeleton(child)
+
+
+def resolve_quantization_mode(mode: Optional[str], device: str) -> str:
+    """Validate a configured mode and adapt it to the device it will run on."""
+    mode = mode or "none"
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unsupported quantization mode: {mode}. Supported modes: {list(QUANTIZATION_MODES)}")
+
+    # Dynamic quantized kernels only exist for CPU
+    if mode == "int8_dynamic" and device != "cpu":
+        print(f"[Quantization] int8_dynamic is CPU-only, using int8_weight_only on {device}")
+        return "int8_weight_only"
+
+    return mode
+
+
+def get_torch_dtype(mode: str, device: str) -> torch.dtype:
+    """Returns the floating point dtype to load a pipeline with."""
+    # CPU kernels (and dynamic quantization in particular) need float32 activations.
+    # This keeps the unquantized parts (VAE, norms, embeddings) in float32 too.
+    if mode != "none" and device == "cpu":
+        return torch.float32
+    return torch.float16
+
+
+def quantize_module(module: nn.Module, mode: str) -> nn.Module:
+    """Quantizes a single module in place (where possible) and returns it."""
+    module.eval()
+    if mode == "int8_dynamic":
+        # Dynamic kernels only cover Linear, so convolutions get int8 weights instead of staying float32
+        _replace_weight_only(module, convs_only=True)
+        return torch.ao.quantization.quantize_dynamic(module, {nn.Linear}, dtype=torch.qint8, inplace=True)
+    if mode == "int8_weight_only":
+        _replace_weight_only(module)
+        return module
+    return module
+
+
+def _quantized_skeleton(module: nn.Module, mode: str) -> nn.Module:
+    """Gives a module with meta weights the layer structure quantize_module would produce, without computing anything."""
+    if mode == "int8_dynamic":
+        _replace_weight_only(module, convs_only=True)
+        _replace_dynamic_linear_skeleton(module)
+    elif mode == "int8_weight_only":
+        _replace_weight_only(module)
+    return module.eval()
+
+
+def get_model_revision(source: str) -> Optional[str]:
+    """Identifies the exact model files a pipeline is loaded from, for keying the cache.
+    Hub models use the commit hash of their cached snapshot, local directories a fingerprint of their files."""
+    path = Path(source)
+    if path.is_dir():
+        fingerprint = hashlib.sha256()
+        for file in sorted(path.rglob("*")):
+            if file.is_file() and file.name.endswith((".safetensors", ".bin", ".json")):
+                stat = file.stat()
+                fingerprint.update(f"{file.relative_to(path).as_posix()}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+        return f"local-{fingerprint.hexdigest()[:16]}"
+
+    # Files in the Hugging Face cache live under snapshots/<commit hash>/
+    try:
+        from huggingface_hub import try_to_load_from_cache
+        cached_file = try_to_load_from_cache(source, "model_index.json")
+    except Exception:
+        return None
+    return Path(cached_file).parent.name if isinstance(cached_file, str) else None
+
+
+def _library_versions() -> str:
+    """Versions of the libraries whose module layout ends up in a cached state dict."""
+    versions = [f"torch={torch.__version__}"]
+    for package in ("diffusers", "transformers"):
+        try:
+            versions.append(f"{package}={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            versions.append(f"{package}=none")
+    return ",".join(versions)
+
+
+def _cache_path(cache_dir: Path, huggingface_id: str, revision: str, component: str, mode: str,
+                dtype: torch.dtype) -> Path:
+    """Cache file for one quantized component, keyed on everything that affects its contents."""
+    safe_id = re.sub(r"[^A-Za-z0-9_.-]", "--", huggingface_id)
+    safe_revision = re.sub(r"[^A-Za-z0-9_.-]", "--", revision)
+    dtype_name = str(dtype).replace("torch.", "")
+    versions_hash = hashlib.sha256(_library_versions().encode()).hexdigest()[:12]
+    return Path(cache_dir) / safe_id / safe_revision / f"{component}-{mode}-{dtype_name}-{versions_hash}.pt"
+
+
+def _build_component_skeleton(source: str, component: str, library: str, class_name: str) -> nn.Module:
+    """Instantiates a pipeline component from its config alone, with its weights on the meta device."""
+    from accelerate import init_empty_weights
+
+    module_class = getattr(importlib.import_module(library), class_name)
+    if library == "diffusers":
+        config = module_class.load_config(source, subfolder=component)
+        build = lambda: module_class.from_config(config)
+    else:
+        config = module_class.config_class.from_pretrained(source, subfolder=component)
+        build = lambda: module_class(config)
+
+    # Buffers stay real, so non-persistent ones (e.g. position ids) are still initialised
+    with init_empty_weights(include_buffers=False):
+        return build()
+
+
+def load_cached_components(source: str, cache_dir: Path, huggingface_id: str, revision: str, mode: str,
+                           dtype: torch.dtype) -> Dict[str, nn.Module]:
+    """Rebuilds previously quantized components from the cache, ready to pass to from_pretrained
+    so their full precision weights are never read. Cache files that don't fit the model are deleted."""
+    paths = {
+        component: _cache_path(cache_dir, huggingface_id, revision, component, mode, dtype)
+        for component in QUANTIZABLE_COMPONENTS
+    }
+    paths = {component: path for component, path in paths.items() if path.exists()}
+    if not paths:
+        return {}
+
+    from diffusers import DiffusionPipeline
+    model_index = DiffusionPipeline.load_config(source)
+
+    loaded = {}
+    for component, path in paths.items():
+        spec = model_index.get(component)
+        if not isinstance(spec, list) or spec[0] is None:
+            continue
+
+        try:
+            module = _quantized_skeleton(_build_component_skeleton(source, component, *spec), mode)
+        except Exception as e:
+            print(f"[Quantization] Could not rebuild {component}, loading it in full precision: {e}")
+            continue
+
+        try:
+            # Only tensors are stored, so nothing in the cache directory gets executed
+            state_dict = torch.load(path, map_location="cpu", weights_only=True)
+            module.load_state_dict(state_dict, strict=True, assign=True)
+            if any(t.is_meta for t in itertools.chain(module.parameters(), module.buffers())):
+                raise ValueError("cached state doesn't cover every weight")
+        except Exception as e:
+            print(f"[Quantization] Discarding cached {component} from {path}: {e}")
+            path.unlink(missing_ok=True)
+            continue
+
+        loaded[component] = module
+        print(f"[Quantization] Loaded cached {component} from {path}")
+    return loaded
+
+
+def save_cached_component(cache_dir: Path, huggingface_id: str, revision: str, component: str,
+                          module: nn.Module, mode: str, dtype: torch.dtype) -> None:
+    """Stores a quantized component's state dict, writing atomically so partial files are never read."""
+    path = _cache_path(cache_dir, huggingface_id, revision, component, mode, dtype)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(".tmp")
+    torch.save(module.state_dict(), tmp_path)
+    os.replace(tmp_path, path)
+
+
+def quantize_pipeline(pipe: Any, mode: str, cache_dir: Optional[Path] = None, huggingface_id: Optional[str] = None,
+                      revision: Optional[str] = None, skip: Iterable[str] = ()) -> Any:
+    """Quantizes the UNet and text encoders of a pipeline, caching results if a cache_dir is given.
+    Components listed in skip (e.g. ones loaded from the cache) are left untouched.
+    Nothing is cached without a revision, since a changed upstream model couldn't be detected."""
+    if mode == "none":
+        return pipe
+
+    for component in QUANTIZABLE_COMPONENTS:
+        module = getattr(pipe, component, None)
+        if module is None or component in skip:
+            continue
+
+        print(f"[Quantization] Applying {mode} to {component}...")
+        dtype = module.dtype
+        module = quantize_module(module, mode)
+        setattr(pipe, component, module)
+
+        if cache_dir is not None and huggingface_id and revision:
+            try:
+                save_cached_component(cache_dir, huggingface_id, revision, component, module, mode, dtype)
+            except Exception as e:
+                print(f"[Quantization] Could not cache {component}: {e}")
+
+    return pipe
+
+
+def get_module_size_bytes(module: nn.Module) -> int:
+    """Returns the memory held by a module's parameters, buffers and packed quantized weights."""
+    size = sum(t.numel() * t.element_size() for t in module.parameters())
+    size += sum(t.numel() * t.element_size() for t in module.buffers())
+
+    # Dynamic quantized Linear layers keep their weights in a packed param outside parameters()
+    for child in module.modules():
+        packed = getattr(child, "_packed_params", None)
+        if packed is not None and hasattr(packed, "_weight_bias"):
+            weight, bias = packed._weight_bias()
+            size += weight.numel() * weight.element_size()
+            if bias is not None:
+                size += bias.numel() * bias.element_size()
+
+    return size
@@ -52,7 +52,7 @@ const defaultParams: GenerateImageParams = {
 const ImageGenerator = () => {
   const backendStatus = useBackendStatus();
 
-  const { data: modelsData, openDownloadTerminal } = useModels({
+  const { data: modelsData, downloadModel } = useModels({
     retry: 10,
     retryDelay: 500,
     enabled: backendStatus.ready, // Only fetch models when backend is ready
@@ -157,7 +157,7 @@ const ImageGenerator = () => {
         excludeKeys: ["output_dir"],
       });
 
-      await openDownloadTerminal(params.model);
+      await downloadModel(params.model);
 
       const response = await generateImage(params);
 
@@ -3,8 +3,8 @@ import { useQuery, UseQueryOptions } from "@tanstack/react-query";
 import {
   getModels,
   getResolutions,
-  openModelDownloadTerminal,
-  checkModelCacheStatus,
+  startModelDownload,
+  getModelDownloadProgress,
 } from "../lib/api";
 
 export const useModels = (
@@ -19,33 +19,29 @@ export const useModels = (
     ...options,
   });
 
-  const openDownloadTerminal = async (modelId: string): Promise<void> => {
-    try {
-      // First check if model is already cached
-      console.log(`Checking cache status for model: ${modelId}`);
-      const cacheStatus = await checkModelCacheStatus(modelId);
+  const downloadModel = async (
+    modelId: string,
+    intervalMs: number = 1000
+  ): Promise<void> => {
+    // The backend returns a completed job right away if the model is already on disk
+    let progress = await startModelDownload(modelId);
 
-      if (cacheStatus.is_cached) {
-        console.log(
-          `Model ${modelId} is already cached, skipping download terminal`
-        );
-        return;
+    while (progress.status !== "completed") {
+      if (progress.status === "failed") {
+        throw new Error(progress.error ?? `Download of ${modelId} failed`);
       }
 
-      // Model is not cached, open download terminal
-      console.log(`Model ${modelId} is not cached, opening download terminal`);
-      await openModelDownloadTerminal(modelId);
-    } catch (error) {
-      console.error(`Error checking cache status for ${modelId}:`, error);
-      // If cache check fails, open terminal anyway as fallback
-      console.log(`Falling back to opening terminal for ${modelId}`);
-      await openModelDownloadTerminal(modelId);
+      console.log(
+        `Downloading ${modelId}: ${progress.progress}% (${progress.bytes_per_second} B/s)`
+      );
+      await new Promise((resolve) => setTimeout(resolve, intervalMs));
+      progress = await getModelDownloadProgress(modelId);
     }
   };
 
   return {
     ...modelsQuery,
-    openDownloadTerminal,
+    downloadModel,
   };
 };
 
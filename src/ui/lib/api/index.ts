@@ -21,6 +21,45 @@ interface GenerateImageResponse {
   params_used: GenerateImageParams;
 }
 
+interface FileDownloadProgress {
+  filename: string;
+  size: number | null;
+  downloaded_bytes: number;
+  status: "queued" | "downloading" | "completed" | "failed";
+}
+
+interface ModelDownloadProgress {
+  model_id: string;
+  huggingface_id: string;
+  status: "queued" | "downloading" | "completed" | "failed";
+  downloaded_bytes: number;
+  total_bytes: number;
+  transferred_bytes: number;
+  progress: number;
+  bytes_per_second: number;
+  files: FileDownloadProgress[];
+  error: string | null;
+}
+
+interface QueuedGenerationResponse {
+  generation_id: string;
+  status: "waiting_for_download";
+  download: ModelDownloadProgress;
+}
+
+interface QueuedGeneration {
+  generation_id: string;
+  model_id: string;
+  status:
+    | "waiting_for_download"
+    | "queued"
+    | "generating"
+    | "completed"
+    | "failed";
+  result: GenerateImageResponse | null;
+  error: string | null;
+}
+
 interface RecommendedParams {
   guidance_scale: number;
   num_inference_steps: number;
@@ -43,7 +82,51 @@ interface ModelsResponse {
 export async function generateImage(params: GenerateImageParams) {
   const backendUrl = await absoluteBackendUrl("/generate");
 
-  const response = await axios.post<GenerateImageResponse>(backendUrl, params);
+  const response = await axios.post<
+    GenerateImageResponse | QueuedGenerationResponse
+  >(backendUrl, params);
+
+  // Model is still downloading, the backend queued the request
+  if (response.status === 202) {
+    const { generation_id } = response.data as QueuedGenerationResponse;
+    return waitForQueuedGeneration(generation_id);
+  }
+
+  return response.data as GenerateImageResponse;
+}
+
+async function waitForQueuedGeneration(
+  generationId: string,
+  intervalMs: number = 2000
+): Promise<GenerateImageResponse> {
+  const backendUrl = await absoluteBackendUrl(`/generate/${generationId}`);
+
+  while (true) {
+    const { data } = await axios.get<QueuedGeneration>(backendUrl);
+
+    if (data.status === "completed" && data.result) {
+      return data.result;
+    }
+    if (data.status === "failed") {
+      throw new Error(data.error ?? "Queued generation failed");
+    }
+
+    await new Promise((resolve) => setTimeout(resolve, intervalMs));
+  }
+}
+
+export async function startModelDownload(modelId: string) {
+  const backendUrl = await absoluteBackendUrl(`/models/${modelId}/download`);
+
+  const response = await axios.post<ModelDownloadProgress>(backendUrl);
+
+  return response.data;
+}
+
+export async function getModelDownloadProgress(modelId: string) {
+  const backendUrl = await absoluteBackendUrl(`/models/${modelId}/download`);
+
+  const response = await axios.get<ModelDownloadProgress>(backendUrl);
 
   return response.data;
 }
@@ -92,8 +175,10 @@ export async function getResolutions() {
 }
 
 export type {
+  FileDownloadProgress,
   GenerateImageParams,
   GenerateImageResponse,
+  ModelDownloadProgress,
   ModelsResponse,
   RecommendedParams,
   SupportedResolution,
@@ -13,6 +13,7 @@ export interface ModelConfig {
     height: number;
   };
   suggested_negative_prompt: string;
+  quantization?: "none" | "int8_dynamic" | "int8_weight_only";
 }
 
 export interface ModelsConfig {
@@ -36,6 +37,11 @@ export interface AppConfig {
     host: string;
     debug: boolean;
   };
+  downloads?: {
+    max_concurrent_files: number;
+    max_bytes_per_second: number;
+    chunk_size_kb: number;
+  };
   defaults: {
     model: string;
   };